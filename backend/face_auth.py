@@ -2,10 +2,12 @@ import os
 import json
 import base64
 import io
-import io
+import asyncio
+import threading
 # import torch # Lazy loaded
 import numpy as np
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Body
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from PIL import Image
 # from facenet_pytorch import MTCNN, InceptionResnetV1 # Lazy loaded
@@ -18,23 +20,51 @@ DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 FACES_FILE = os.path.join(DATA_DIR, "faces.json")
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# Max number of face detection/embedding jobs allowed to run at once.
+# MTCNN + ResNet are CPU heavy; letting every request in at once only
+# starves the thread pool that the other routes also depend on.
+FACE_MODEL_CONCURRENCY = int(os.environ.get("FACE_MODEL_CONCURRENCY", "2"))
+
 # --- Global Models (Lazy Loading to prevent slow startup if not used) ---
 mtcnn = None
 resnet = None
+# get_models runs in thread-pool workers; this keeps concurrent cold starts from loading twice
+models_lock = threading.Lock()
+
+# --- Async primitives (created lazily so they bind to the server's event loop) ---
+faces_lock = None
+model_semaphore = None
+
+def get_faces_lock():
+    """Serializes every read-modify-write of the face store."""
+    global faces_lock
+    if faces_lock is None:
+        faces_lock = asyncio.Lock()
+    return faces_lock
+
+def get_model_semaphore():
+    global model_semaphore
+    if model_semaphore is None:
+        model_semaphore = asyncio.Semaphore(FACE_MODEL_CONCURRENCY)
+    return model_semaphore
 
 def get_models():
     global mtcnn, resnet
     if mtcnn is None:
-        print("Loading FaceNet models...")
-        import torch
-        from facenet_pytorch import MTCNN, InceptionResnetV1
-        
-        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        # MTCNN for face detection (using keep_all=False to get the best face)
-        mtcnn = MTCNN(image_size=160, margin=0, keep_all=False, device=device)
-        # InceptionResnetV1 for embedding
-        resnet = InceptionResnetV1(pretrained='vggface2').eval().to(device)
-        print("FaceNet models loaded.")
+        with models_lock:
+            # Re-check: another worker may have finished loading while we waited
+            if mtcnn is None:
+                print("Loading FaceNet models...")
+                import torch
+                from facenet_pytorch import MTCNN, InceptionResnetV1
+                
+                device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+                # InceptionResnetV1 for embedding
+                resnet = InceptionResnetV1(pretrained='vggface2').eval().to(device)
+                # MTCNN for face detection (using keep_all=False to get the best face)
+                # Assigned last since it is the "loaded" flag checked outside the lock
+                mtcnn = MTCNN(image_size=160, margin=0, keep_all=False, device=device)
+                print("FaceNet models loaded.")
     return mtcnn, resnet
 
 # --- Helper Functions ---
@@ -49,13 +79,19 @@ def load_faces():
         return {}
 
 def save_faces(faces_data):
-    with open(FACES_FILE, "w") as f:
+    # Write to a temp file and swap it in so a crash mid-write can't corrupt the store
+    tmp_file = FACES_FILE + ".tmp"
+    with open(tmp_file, "w") as f:
         json.dump(faces_data, f, indent=2)
+    os.replace(tmp_file, FACES_FILE)
+
+async def load_faces_async():
+    async with get_faces_lock():
+        return await run_in_threadpool(load_faces)
 
-def process_image(image_file: UploadFile):
-    """Reads an upload file and converts it to a PIL Image."""
+def process_image(image_bytes: bytes):
+    """Decodes raw upload bytes into a PIL Image."""
     try:
-        image_bytes = image_file.file.read()
         image = Image.open(io.BytesIO(image_bytes))
         
         # Convert to RGB if not already (e.g. if PNG has alpha)
@@ -90,6 +126,28 @@ def get_embedding(image: Image.Image):
     # Detach from graph and convert to numpy
     return embedding.detach().cpu().numpy()[0]
 
+def embed_image_bytes(image_bytes: bytes):
+    """Blocking decode + detect + embed. Always call through run_in_threadpool."""
+    image = process_image(image_bytes)
+    return get_embedding(image)
+
+async def compute_embedding(file: UploadFile):
+    """
+    Reads the upload without blocking the event loop and runs the face models
+    in the thread pool, bounded by FACE_MODEL_CONCURRENCY.
+    """
+    image_bytes = await file.read()
+    async with get_model_semaphore():
+        return await run_in_threadpool(embed_image_bytes, image_bytes)
+
+def match_face(embedding, faces):
+    """Returns (best_name, best_score) over all registered faces."""
+    names = list(faces.keys())
+    stored = np.array([faces[name] for name in names])
+    scores = cosine_similarity(embedding.reshape(1, -1), stored).flatten()
+    best_idx = int(np.argmax(scores))
+    return names[best_idx], float(scores[best_idx])
+
 # --- Endpoints ---
 
 @router.post("/face/register")
@@ -100,19 +158,20 @@ async def register_face(name: str = Form(...), file: UploadFile = File(...)):
     if not name:
         raise HTTPException(status_code=400, detail="Name is required")
     
-    image = process_image(file)
-    embedding = get_embedding(image)
+    embedding = await compute_embedding(file)
     
     if embedding is None:
         raise HTTPException(status_code=400, detail="No face detected in the image.")
     
-    faces = load_faces()
-    
-    # Check if name already exists (optional: allow overwriting or list)
-    # For simplicity, we overwrite or add
-    faces[name] = embedding.tolist() # Convert numpy array to list for JSON serialization
-    
-    save_faces(faces)
+    # Hold the lock across load + save so concurrent registrations don't drop each other
+    async with get_faces_lock():
+        faces = await run_in_threadpool(load_faces)
+        
+        # Check if name already exists (optional: allow overwriting or list)
+        # For simplicity, we overwrite or add
+        faces[name] = embedding.tolist() # Convert numpy array to list for JSON serialization
+        
+        await run_in_threadpool(save_faces, faces)
     
     return {"message": f"Face registered successfully for user: {name}"}
 
@@ -122,30 +181,19 @@ async def recognize_face(file: UploadFile = File(...)):
     Recognizes a face from the uploaded image.
     Returns the matched name if similarity > threshold.
     """
-    image = process_image(file)
-    embedding = get_embedding(image)
+    embedding = await compute_embedding(file)
     
     if embedding is None:
         raise HTTPException(status_code=400, detail="No face detected.")
     
-    faces = load_faces()
+    faces = await load_faces_async()
     if not faces:
         raise HTTPException(status_code=404, detail="No registered faces found.")
     
-    best_match = None
-    best_score = -1.0
     threshold = 0.6  # typical threshold for Facenet, might need tuning
     
-    # Compare with all registered faces
-    target_emb = embedding.reshape(1, -1)
-    
-    for name, stored_emb_list in faces.items():
-        stored_emb = np.array(stored_emb_list).reshape(1, -1)
-        score = cosine_similarity(target_emb, stored_emb)[0][0]
-        
-        if score > best_score:
-            best_score = score
-            best_match = name
+    # Compare with all registered faces in one matrix op
+    best_match, best_score = await run_in_threadpool(match_face, embedding, faces)
             
     if best_score > threshold:
         return {
@@ -162,6 +210,6 @@ async def recognize_face(file: UploadFile = File(...)):
         }
 
 @router.get("/face/list")
-def list_faces():
-    faces = load_faces()
+async def list_faces():
+    faces = await load_faces_async()
     return {"registered_users": list(faces.keys())}
@@ -20,6 +20,24 @@ class Forecaster:
         # Ensure data is sorted by date
         self.df = self.df.sort_values('Date')
 
+    def forecast_values(self, values, steps=6):
+        """
+        Forecasts the next `steps` periods for a plain sequence of sales values.
+        Returns an empty array if there is too little data or the model fails.
+        """
+        # We need at least 2 points for a simple trend, but ARIMA usually needs more
+        if len(values) < 3:
+            return np.array([])
+        try:
+            # Train ARIMA(1,1,0) - simple for small datasets
+            model = ARIMA(np.asarray(values, dtype=float), order=(1, 1, 0))
+            model_fit = model.fit()
+            return np.asarray(model_fit.forecast(steps=steps))
+        except Exception as e:
+            print(f"Forecasting error: {e}")
+            # Fallback: simple average/trend if ARIMA fails
+            return np.array([])
+
     def get_forecast(self, sku=None, days=6):
         """
         sku: Optional SKU to filter by.
@@ -53,32 +71,21 @@ class Forecaster:
             })
 
         forecast_data = []
-        if len(sales_series) >= 3:
-            try:
-                # Train ARIMA(1,1,0) - simple for small datasets
-                model = ARIMA(sales_series.values, order=(1, 1, 0))
-                model_fit = model.fit()
-                
-                # Forecast
-                forecast = model_fit.forecast(steps=days)
-                
-                # Generate future dates
-                last_date = sales_series.index.max()
-                # Assuming monthly if dates are 1st of month, else daily
-                # Let's detect frequency or default to daily
-                freq = 'MS' if sales_series.index[1].day == sales_series.index[0].day else 'D'
-                future_dates = pd.date_range(start=last_date + pd.Timedelta(days=1), periods=days, freq=freq)
+        forecast = self.forecast_values(sales_series.values, days)
+        if len(forecast):
+            # Generate future dates
+            last_date = sales_series.index.max()
+            # Assuming monthly if dates are 1st of month, else daily
+            # Let's detect frequency or default to daily
+            freq = 'MS' if sales_series.index[1].day == sales_series.index[0].day else 'D'
+            future_dates = pd.date_range(start=last_date + pd.Timedelta(days=1), periods=days, freq=freq)
 
-                for d, v in zip(future_dates, forecast):
-                    forecast_data.append({
-                        'date': d.strftime('%Y-%m-%d'),
-                        'sales': max(0, int(v)),
-                        'type': 'forecast'
-                    })
-            except Exception as e:
-                print(f"Forecasting error: {e}")
-                # Fallback: simple average/trend if ARIMA fails
-                pass
+            for d, v in zip(future_dates, forecast):
+                forecast_data.append({
+                    'date': d.strftime('%Y-%m-%d'),
+                    'sales': max(0, int(v)),
+                    'type': 'forecast'
+                })
 
         return history + forecast_data
 
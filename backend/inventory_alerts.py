@@ -0,0 +1,224 @@
+import math
+import threading
+from collections import deque
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+
+# Rolling window (in sales periods) for the recent demand average
+DEMAND_WINDOW = 3
+# Smoothing factor for the exponentially weighted demand rate
+EWMA_ALPHA = 0.5
+# Sales periods kept per SKU as forecaster input
+HISTORY_LENGTH = 36
+# Number of future periods forecast per SKU
+FORECAST_HORIZON = 6
+# Days of cover at or below which a SKU is flagged
+CRITICAL_DAYS = 30
+WARNING_DAYS = 60
+DEFAULT_PERIOD_DAYS = 30.4
+
+class DemandStats:
+    """Running demand statistics for one SKU, updated one sales row at a time."""
+    __slots__ = ('sku', 'name', 'count', 'mean', 'm2', 'ewma', 'recent', 'history',
+                 'last_date', 'period_days', 'stock', 'version')
+
+    def __init__(self, sku, name=''):
+        self.sku = sku
+        self.name = name
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # Sum of squared deviations (Welford)
+        self.ewma = 0.0
+        self.recent = deque(maxlen=DEMAND_WINDOW)
+        self.history = deque(maxlen=HISTORY_LENGTH)
+        self.last_date = None
+        self.period_days = DEFAULT_PERIOD_DAYS
+        self.stock = 0
+        self.version = 0  # Bumped on every update so refresh can detect stale snapshots
+
+    def update(self, date, quantity, stock):
+        self.count += 1
+        delta = quantity - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (quantity - self.mean)
+        self.ewma = quantity if self.count == 1 else EWMA_ALPHA * quantity + (1 - EWMA_ALPHA) * self.ewma
+        self.recent.append(quantity)
+        self.history.append(quantity)
+        self.version += 1
+        # InventoryAlerts.ingest guarantees rows arrive strictly after last_date
+        if self.last_date is not None:
+            self.period_days = (date - self.last_date).days or DEFAULT_PERIOD_DAYS
+        self.last_date = date
+        self.stock = stock
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else 0.0
+
+class InventoryAlerts:
+    """
+    Catalog-wide stockout risk table built from the sales history.
+
+    The sales table is walked once, row by row, updating DemandStats per SKU. Each
+    SKU's projected demand (forecast when available, EWMA otherwise) is run down
+    against its current stock to get days of cover and a projected stockout date.
+    The ranked table is precomputed; ingesting new rows only recomputes the SKUs
+    they touch.
+    """
+    def __init__(self, forecaster=None):
+        self.forecaster = forecaster
+        self.stats = {}
+        self.rows = {}  # sku -> alert row
+        self.table = []  # Alert rows sorted by projected stockout
+        self.dirty = set()
+        self.lock = threading.Lock()
+
+    def load(self, df):
+        """Ingests a sales DataFrame (Date, SKU, Quantity_Sold, Stock[, ProductName]) and builds the table."""
+        names = df['ProductName'] if 'ProductName' in df.columns else pd.Series('', index=df.index)
+        self.ingest(zip(pd.to_datetime(df['Date']), df['SKU'], df['Quantity_Sold'].fillna(0),
+                        df['Stock'].fillna(0), names.fillna('')))
+        self.refresh(use_forecast=False)
+
+    def ingest(self, rows):
+        """
+        Updates running stats from (date, sku, quantity_sold, stock[, name]) tuples.
+
+        The batch is applied all-or-nothing: every row is parsed first, each SKU's rows
+        are sorted by date, and a ValueError is raised (with nothing applied) if any row
+        is malformed (bad date, non-finite or negative quantity, negative stock) or not
+        dated strictly after the last row already seen for its SKU.
+        """
+        parsed = []
+        for i, row in enumerate(rows):
+            try:
+                date, sku, quantity, stock = row[:4]
+                date = pd.Timestamp(date)
+                if pd.isna(date):
+                    raise ValueError("missing date")
+                quantity, stock = float(quantity), int(stock)
+                # NaN/inf would poison the running stats for good; negatives fake "never runs out"
+                if not math.isfinite(quantity) or quantity < 0:
+                    raise ValueError(f"quantity_sold must be a finite number >= 0, got {quantity}")
+                if stock < 0:
+                    raise ValueError(f"stock must be >= 0, got {stock}")
+                name = str(row[4]) if len(row) > 4 and row[4] else ''
+                parsed.append((str(sku), date, quantity, stock, name))
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Invalid sales row {i}: {e}")
+        # Stable sort: date order within each SKU
+        parsed.sort(key=lambda r: (r[0], r[1]))
+
+        with self.lock:
+            # Validate the whole batch before touching any stats
+            last_dates = {}
+            for sku, date, _, _, _ in parsed:
+                if sku in last_dates:
+                    last = last_dates[sku]
+                else:
+                    last = self.stats[sku].last_date if sku in self.stats else None
+                if last is not None and date <= last:
+                    raise ValueError(
+                        f"Sales row for {sku} dated {date:%Y-%m-%d} is not after its last recorded period {last:%Y-%m-%d}")
+                last_dates[sku] = date
+
+            for sku, date, quantity, stock, name in parsed:
+                stats = self.stats.get(sku)
+                if stats is None:
+                    stats = self.stats[sku] = DemandStats(sku, name)
+                stats.update(date, quantity, stock)
+                self.dirty.add(sku)
+
+    def refresh(self, use_forecast=True, skus=None):
+        """
+        Recomputes alert rows for dirty SKUs (or the given SKUs) and re-ranks the table.
+        Forecasts run outside the lock so ingestion and reads are never blocked on them.
+        """
+        with self.lock:
+            targets = set(self.dirty) if skus is None else set(skus) & set(self.stats)
+            self.dirty -= targets
+            snapshots = {sku: list(self.stats[sku].history) for sku in targets}
+            versions = {sku: self.stats[sku].version for sku in targets}
+
+        forecasts = {}
+        if use_forecast and self.forecaster is not None:
+            for sku, history in snapshots.items():
+                forecasts[sku] = self.forecaster.forecast_values(history, FORECAST_HORIZON)
+
+        with self.lock:
+            for sku in targets:
+                stats = self.stats[sku]
+                if stats.version != versions[sku]:
+                    # New rows arrived while forecasting: this forecast is stale, leave it for the next refresh
+                    self.dirty.add(sku)
+                    continue
+                self.rows[sku] = self.build_row(stats, forecasts.get(sku))
+            self.table = sorted(self.rows.values(), key=stockout_sort_key)
+
+    def build_row(self, stats, forecast=None):
+        if forecast is not None and len(forecast):
+            demand = [max(0.0, float(v)) for v in forecast]
+            source = 'forecast'
+        else:
+            demand = [stats.ewma] * FORECAST_HORIZON
+            source = 'rolling'
+
+        days_of_cover = run_down(stats.stock, demand, stats.ewma, stats.period_days)
+        # Stock is the level at the end of the last observed period
+        as_of = stats.last_date + timedelta(days=stats.period_days)
+        stockout_date = None
+        if days_of_cover is not None:
+            stockout_date = (as_of + timedelta(days=days_of_cover)).strftime('%Y-%m-%d')
+
+        if days_of_cover is not None and days_of_cover <= CRITICAL_DAYS:
+            risk = 'critical'
+        elif days_of_cover is not None and days_of_cover <= WARNING_DAYS:
+            risk = 'warning'
+        else:
+            risk = 'ok'
+
+        return {
+            'product_id': str(stats.sku),
+            'product_name': stats.name,
+            'stock': stats.stock,
+            'avg_demand': round(stats.mean, 2),
+            'demand_std': round(stats.std, 2),
+            'recent_demand': round(sum(stats.recent) / len(stats.recent), 2) if stats.recent else 0.0,
+            'ewma_demand': round(stats.ewma, 2),
+            'projected_demand': [round(v, 2) for v in demand],
+            'demand_source': source,
+            'days_of_cover': None if days_of_cover is None else round(days_of_cover, 1),
+            'stockout_date': stockout_date,
+            'risk': risk,
+            'last_sale_date': stats.last_date.strftime('%Y-%m-%d'),
+        }
+
+    def get_alerts(self, limit=50, risk=None):
+        table = self.table
+        if risk:
+            table = [row for row in table if row['risk'] == risk]
+        return table[:max(limit, 0)]
+
+def run_down(stock, demand, tail_rate, period_days):
+    """
+    Days until stock runs out, consuming demand[i] units per period and tail_rate per
+    period after the horizon. None if demand never depletes the stock.
+    """
+    remaining = float(stock)
+    days = 0.0
+    if remaining <= 0:
+        return 0.0
+    for per_period in demand:
+        if per_period >= remaining:
+            return days + remaining / per_period * period_days
+        remaining -= per_period
+        days += period_days
+    if tail_rate <= 0:
+        return None
+    return days + remaining / tail_rate * period_days
+
+def stockout_sort_key(row):
+    # Soonest stockout first; SKUs that never run out go last
+    days = row['days_of_cover']
+    return (days is None, days if days is not None else 0.0, row['product_id'])
@@ -1,13 +1,18 @@
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional, List
-import pandas as pd
+from fastapi.responses import Response, StreamingResponse
+from typing import Optional, List, Literal
 from recommender import Recommender
 from forecaster import Forecaster
+from inventory_alerts import InventoryAlerts
 import uvicorn
 import traceback
-from pydantic import BaseModel
+import uuid
+import json
+import threading
+from pydantic import BaseModel, confloat, conint
 from rag_engine import RAGEngine
+from session_store import create_session_store, client_session_key
 import face_auth
 import voice_agent
 
@@ -26,7 +31,14 @@ app.add_middleware(
 DATA_PATH = "jewelry_combined.csv"
 recommender = Recommender(DATA_PATH)
 forecaster = Forecaster(DATA_PATH)
-rag_engine = RAGEngine(DATA_PATH)
+# Stockout risk table: built from rolling demand stats now, refined with forecasts after startup
+inventory_alerts = InventoryAlerts(forecaster)
+if forecaster.df is not None:
+    inventory_alerts.load(forecaster.df)
+# Share the recommender's columnar product catalog instead of building a second one
+rag_engine = RAGEngine(DATA_PATH, catalog=recommender.catalog)
+# Conversation state shared by /chat and /voice/chat (follow-ups reuse previous results)
+session_store = create_session_store()
 
 app.include_router(face_auth.router)
 app.include_router(voice_agent.router)
@@ -38,6 +50,10 @@ async def startup_event():
     
     # Inject RAGEngine dependency into Voice Agent
     voice_agent.set_rag_engine(rag_engine)
+    voice_agent.set_session_store(session_store)
+
+    # Fit per-SKU forecasts for the alert table in the background so startup stays fast
+    threading.Thread(target=inventory_alerts.refresh, kwargs={"skus": list(inventory_alerts.stats)}, daemon=True).start()
 
 @app.get("/")
 def read_root():
@@ -58,6 +74,25 @@ def get_recommendations(product_id: str, n: int = 5):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+class BatchRecommendRequest(BaseModel):
+    product_ids: List[str]
+    n: int = 5
+
+@app.post("/recommend/batch")
+def batch_recommendations(request: BatchRecommendRequest):
+    """
+    Similar items for many SKUs in one call, streamed back as NDJSON
+    (one {"product_id", "recommendations"} object per line, in request order).
+    """
+    def stream():
+        for sku, results in recommender.get_batch_recommendations(request.product_ids, request.n):
+            line = {"product_id": sku, "recommendations": results or []}
+            if results is None:
+                line["error"] = "Product SKU not found in catalog"
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @app.get("/forecast")
 def get_forecast(product_id: Optional[str] = None):
     try:
@@ -68,45 +103,83 @@ def get_forecast(product_id: Optional[str] = None):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/inventory/alerts")
+def get_inventory_alerts(limit: int = Query(50, ge=1),
+                         risk: Optional[Literal['critical', 'warning', 'ok']] = Query(None)):
+    """
+    SKUs ranked by projected stockout date (soonest first), from the precomputed alert table.
+    risk: optional filter - 'critical', 'warning' or 'ok'.
+    """
+    return inventory_alerts.get_alerts(limit, risk)
+
+class SalesRow(BaseModel):
+    date: str
+    product_id: str
+    quantity_sold: confloat(ge=0, allow_inf_nan=False)
+    stock: conint(ge=0)
+    product_name: Optional[str] = None
+
+class SalesUpdate(BaseModel):
+    rows: List[SalesRow]
+
+@app.post("/inventory/sales")
+def ingest_sales(update: SalesUpdate):
+    """Adds new sales rows to the alert pipeline and recomputes only the SKUs they touch."""
+    try:
+        rows = [(r.date, r.product_id, r.quantity_sold, r.stock, r.product_name) for r in update.rows]
+        inventory_alerts.ingest(rows)
+    except ValueError as e:
+        # Malformed, duplicate or out-of-order rows: nothing was applied
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        inventory_alerts.refresh()
+        return {"ingested": len(rows), "skus": len({r.product_id for r in update.rows})}
+    except Exception as e:
+        print(f"Error refreshing inventory alerts: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/products")
-def list_products(limit: int = 50):
+def list_products(limit: int = 50, offset: int = 0):
     """Returns a list of unique products for the demo UI."""
-    if recommender.products_df is None:
+    if recommender.catalog is None:
         return []
     
-    # Take a sample for the listing
-    sample = recommender.products_df.head(limit).to_dict(orient='records')
-    
-    # Ensure keys are frontend-friendly (SKU as product_id)
-    formatted = []
-    for p in sample:
-        formatted.append({
-            'product_id': str(p['SKU']),
-            'product_name': str(p['ProductName']),
-            'category_code': str(p['Category']),
-            'price': float(p['Price(INR)']),
-            'material': str(p['Material']),
-            'gem': str(p['Style']), # Mapping Style to gem/secondary attribute for UI slots
-            'color': str(p['Color']),
-            'gender': str(p['Gender']),
-            'occasion': str(p['Occasion']),
-            'rating': float(p['Rating']) if not pd.isna(p['Rating']) else 0.0,
-            'stock': int(p['Stock']) if not pd.isna(p['Stock']) else 0
-        })
-    return formatted
+    # Cards are pre-rendered to JSON once, so a page is just a slice + join
+    page = recommender.catalog.listing_page(max(offset, 0), max(limit, 0))
+    return Response(content=page, media_type="application/json")
 
 class ChatRequest(BaseModel):
     message: str
+    session_id: Optional[str] = None  # Echo back the returned session_id to keep context between turns
 
 @app.post("/chat")
 def chat_endpoint(request: ChatRequest):
     try:
-        response = rag_engine.process_query(request.message)
+        session_id = request.session_id or uuid.uuid4().hex
+        response = rag_engine.process_query(request.message, session_store.get(client_session_key(session_id)))
+        response['session_id'] = session_id
         return response
     except Exception as e:
         print(f"Error in chat: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    n: int = 4
+
+@app.post("/search/batch")
+def batch_search(request: BatchSearchRequest):
+    """
+    Semantic product matches for many phrases in one call, streamed back as NDJSON
+    (one {"query", "products"} object per line, in request order).
+    """
+    def stream():
+        for query, products in rag_engine.search_batch(request.queries, request.n):
+            yield json.dumps({"query": query, "products": products}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,101 @@
+import json
+from functools import cached_property
+import numpy as np
+import pandas as pd
+
+# Fields included in each response shape, in output order (key -> column)
+SEARCH_FIELDS = ('product_id', 'product_name', 'category_code', 'price', 'image_url', 'material')
+RECOMMEND_FIELDS = ('product_id', 'product_name', 'category_code', 'price', 'material', 'color', 'rating', 'stock')
+LISTING_FIELDS = ('product_id', 'product_name', 'category_code', 'price', 'material', 'gem', 'color',
+                  'gender', 'occasion', 'rating', 'stock')
+
+class ProductCatalog:
+    """
+    Columnar view of the deduplicated product table.
+
+    Every column is extracted once into a NumPy array and each response card shape
+    is built once, the first time it is used, so assembling a result is an
+    index-gather instead of a per-row DataFrame.iloc lookup. One catalog is meant
+    to be shared by every engine loaded from the same product table.
+    """
+    def __init__(self, products_df):
+        def text(col):
+            return products_df[col].fillna('').astype(str).to_numpy()
+
+        def number(col, dtype):
+            return pd.to_numeric(products_df[col], errors='coerce').fillna(0).to_numpy(dtype=dtype)
+
+        self.sku = text('SKU')
+        self.name = text('ProductName')
+        self.category = text('Category')
+        self.material = text('Material')
+        self.style = text('Style')
+        self.color = text('Color')
+        self.gender = text('Gender')
+        self.occasion = text('Occasion')
+        self.price = number('Price(INR)', float)
+        self.rating = number('Rating', float)
+        self.stock = number('Stock', np.int64)
+        self.image_url = np.array(
+            [f"https://placehold.co/300x300?text={name.replace(' ', '+')}" for name in self.name], dtype=object)
+
+        self.positions = {sku: i for i, sku in enumerate(self.sku)}
+
+    def __len__(self):
+        return len(self.sku)
+
+    def matches(self, products_df):
+        """True if this catalog has the same SKUs, in the same order, as products_df."""
+        skus = products_df['SKU'].fillna('').astype(str).to_numpy()
+        return len(skus) == len(self.sku) and bool((skus == self.sku).all())
+
+    # Card projections are built lazily: each engine only uses one or two of them
+
+    @cached_property
+    def search_cards(self):
+        return self.project(SEARCH_FIELDS)
+
+    @cached_property
+    def recommend_cards(self):
+        return self.project(RECOMMEND_FIELDS)
+
+    @cached_property
+    def listing_cards(self):
+        return self.project(LISTING_FIELDS)
+
+    @cached_property
+    def listing_json(self):
+        # Pre-rendered JSON for each listing card so paginated listings are a byte join
+        return [json.dumps(card).encode('utf-8') for card in self.listing_cards]
+
+    def project(self, fields):
+        """One dict per product with the given fields, in output order."""
+        columns = {
+            'product_id': self.sku,
+            'product_name': self.name,
+            'category_code': self.category,
+            'price': self.price.tolist(),
+            'image_url': self.image_url,
+            'material': self.material,
+            'gem': self.style,  # Mapping Style to gem/secondary attribute for UI slots
+            'color': self.color,
+            'gender': self.gender,
+            'occasion': self.occasion,
+            'rating': self.rating.tolist(),
+            'stock': self.stock.tolist(),
+        }
+        return [dict(zip(fields, row)) for row in zip(*(columns[f] for f in fields))]
+
+    def position(self, sku):
+        """Positional index for a SKU, or None if it isn't in the catalog."""
+        return self.positions.get(sku)
+
+    def gather(self, cards, positions, scores=None):
+        """Returns copies of cards[positions], with a 'score' key when scores are given."""
+        if scores is None:
+            return [dict(cards[i]) for i in positions]
+        return [dict(cards[i], score=s) for i, s in zip(np.asarray(positions).tolist(), np.asarray(scores, dtype=float).tolist())]
+
+    def listing_page(self, offset=0, limit=50):
+        """JSON array bytes for a slice of the product listing."""
+        return b'[' + b','.join(self.listing_json[offset:offset + limit]) + b']'
@@ -1,19 +1,46 @@
 import pandas as pd
 import numpy as np
 # from sentence_transformers import SentenceTransformer # Lazy loaded
-from sklearn.metrics.pairwise import cosine_similarity
 import os
+import re
 import random
+from product_catalog import ProductCatalog
+from ranking import top_k, blocks
+
+# Voice turns speak a few results
+VOICE_RESULTS = 3
+# Size of the candidate pool kept on a session so follow-ups can be answered from it
+SESSION_CANDIDATES = 50
+# Queries encoded and scored per dense matrix product in batch search
+BATCH_BLOCK_SIZE = 256
+
+# Words that carry no meaning in a follow-up like "show me the cheaper ones in silver"
+FOLLOW_UP_FILLER = {
+    'show', 'me', 'the', 'ones', 'one', 'in', 'what', 'about', 'any', 'those', 'these', 'them',
+    'something', 'do', 'you', 'have', 'instead', 'with', 'only', 'please', 'some', 'and', 'a',
+    'an', 'how', 'is', 'are', 'there', 'options', 'option', 'now', 'then', 'same', 'but',
+    'rupees', 'rs', 'inr', 'price', 'priced', 'for', 'can', 'i', 'see', 'get', 'of', 'or',
+}
+CHEAPER_PHRASES = ('cheaper', 'less expensive', 'lower price', 'more affordable')
+PRICIER_PHRASES = ('pricier', 'more expensive', 'higher price', 'costlier')
+MAX_PRICE_PATTERN = re.compile(r'\b(?:under|below|less than|within|up to|upto|max)\s+(\d[\d,]*)\s*(k)?\b')
+MIN_PRICE_PATTERN = re.compile(r'\b(?:above|over|more than|at least|min)\s+(\d[\d,]*)\s*(k)?\b')
+
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
 
 class RAGEngine:
-    def __init__(self, data_path):
+    def __init__(self, data_path, catalog=None):
         self.data_path = data_path
         self.df = None
         self.products_df = None
+        self.catalog = catalog # Optional ProductCatalog shared with the Recommender
         self.embeddings = None
+        self.unit_embeddings = None # L2-normalized copy used for cosine scoring
         self.model = None # Lazy load
-        self.products_df = None
-        self.embeddings = None
         
         # Paths for caching
         self.cache_dir = os.path.join(os.path.dirname(__file__), "data")
@@ -56,6 +83,18 @@ class RAGEngine:
 
         self.products_df['search_text'] = self.products_df.apply(create_search_text, axis=1)
 
+        # Reuse the shared catalog if one was injected for the same product table
+        if self.catalog is None or not self.catalog.matches(self.products_df):
+            self.catalog = ProductCatalog(self.products_df)
+
+        # Columns used to filter candidate sets for follow-up queries
+        self.prices = self.catalog.price
+        self.materials = np.char.lower(self.catalog.material.astype(str))
+        self.colors = np.char.lower(self.catalog.color.astype(str))
+        # Longest first so "rose gold" is matched before "gold"
+        self.material_vocab = sorted(set(self.materials) - {''}, key=len, reverse=True)
+        self.color_vocab = sorted(set(self.colors) - {''}, key=len, reverse=True)
+
     def ensure_embeddings(self):
         """
         Ensures embeddings are available. Computes and saves them if missing.
@@ -73,44 +112,99 @@ class RAGEngine:
         except Exception as e:
              print(f"Failed to save embeddings cache: {e}")
 
-    def search_products(self, query, n=4):
+    def get_unit_embeddings(self):
         """
-        Retrieves the top N products matching the query using semantic search.
+        Returns the product embeddings L2-normalized (float32), so cosine similarity is a plain dot product.
+        """
+        self.ensure_embeddings()
+        if self.embeddings is None:
+            return None
+        if self.unit_embeddings is None:
+            self.unit_embeddings = normalize_rows(self.embeddings)
+        return self.unit_embeddings
+
+    def encode_query(self, query):
+        """Returns the embedding vector for a query string."""
+        return self.get_model().encode([query])[0]
+
+    def rank(self, query_embedding, n=4, threshold=0.2, mask=None):
+        """
+        Scores the catalog against a query embedding and returns (positions, scores) of the
+        top N, dropping anything below the relevance threshold. mask restricts the candidates.
+        """
+        unit_embeddings = self.get_unit_embeddings()
+        if unit_embeddings is None:
+             return np.array([], dtype=int), np.array([])
+
+        # Compute cosine similarity
+        similarities = unit_embeddings @ normalize_rows(query_embedding.reshape(1, -1))[0]
+        if mask is not None:
+            similarities = np.where(mask, similarities, -1.0)
+        
+        # Get top N indices, dropping anything below the relevance threshold
+        top_indices, top_scores = top_k(similarities, n)
+        keep = top_scores >= threshold
+        return top_indices[keep], top_scores[keep]
+
+    def retrieve(self, query, n=4, threshold=0.2):
+        """
+        Retrieval only: returns (positions, scores) of the top N products for the query,
+        without building any product cards.
         """
         if self.products_df is None:
-             return []
+             return np.array([], dtype=int), np.array([])
              
         self.ensure_embeddings()
         if self.embeddings is None:
-             return []
+             return np.array([], dtype=int), np.array([])
 
-        # Encode the query
-        query_embedding = self.get_model().encode([query])
-        
-        # Compute similarity
-        similarities = cosine_similarity(query_embedding, self.embeddings).flatten()
-        
-        # Get top N indices
-        top_indices = np.argsort(similarities)[::-1][:n]
-        
-        results = []
-        for idx in top_indices:
-            score = similarities[idx]
-            if score < 0.2: # Low relevance threshold
-                continue
-                
-            prod = self.products_df.iloc[idx]
-            results.append({
-                'product_id': str(prod['SKU']),
-                'product_name': str(prod['ProductName']),
-                'category_code': str(prod['Category']),
-                'price': float(prod['Price(INR)']),
-                'image_url': f"https://placehold.co/300x300?text={prod['ProductName'].replace(' ', '+')}", # Placeholder or real URL if available
-                'material': str(prod['Material']),
-                'score': float(score)
-            })
-            
-        return results
+        return self.rank(self.encode_query(query), n, threshold)
+
+    def search_products(self, query, n=4):
+        """
+        Retrieves the top N products matching the query using semantic search.
+        """
+        top_indices, top_scores = self.retrieve(query, n)
+        return self.product_cards(top_indices, top_scores)
+
+    def search_batch(self, queries, n=4, threshold=0.2, block_size=BATCH_BLOCK_SIZE):
+        """
+        Yields (query, products) for every input query, in order. Queries are encoded and
+        scored block_size at a time with one dense matrix product per block.
+        """
+        unit_embeddings = self.get_unit_embeddings() if self.products_df is not None else None
+        if unit_embeddings is None:
+            for query in queries:
+                yield query, []
+            return
+
+        for start, stop in blocks(len(queries), block_size):
+            chunk = queries[start:stop]
+            query_embeddings = normalize_rows(self.get_model().encode(chunk))
+            similarities = query_embeddings @ unit_embeddings.T
+            top_indices, top_scores = top_k(similarities, n)
+            for query, positions, scores in zip(chunk, top_indices, top_scores):
+                keep = scores >= threshold
+                yield query, self.product_cards(positions[keep], scores[keep])
+
+    def voice_products(self, positions, scores):
+        """
+        Minimal product dicts for speech, read straight from the catalog columns
+        (only the fields the voice templates use; no card copies).
+        """
+        catalog = self.catalog
+        return [{
+            'product_name': catalog.name[i],
+            'material': catalog.material[i],
+            'price': float(catalog.price[i]),
+            'score': float(score)
+        } for i, score in zip(np.asarray(positions).tolist(), np.asarray(scores).tolist())]
+
+    def product_cards(self, positions, scores):
+        """
+        Builds the product dicts returned to the chat UI (gathered from the prebuilt catalog cards).
+        """
+        return self.catalog.gather(self.catalog.search_cards, positions, scores)
 
     def generate_response(self, query, products):
         """
@@ -155,6 +249,155 @@ class RAGEngine:
                 
             return f"{main_desc}{suggestion}{follow_up} You can see them all on your screen."
 
+    def generate_voice_response(self, products, refinement=None):
+        """
+        Shorter, speech-friendly variant of generate_response (no screen references, no markdown).
+        """
+        if not products:
+            if refinement == 'cheaper':
+                return "I couldn't find anything cheaper among those options. Would you like to search for something else?"
+            if refinement == 'pricier':
+                return "Those were the most premium options I found. Would you like to search for something else?"
+            return "I couldn't find any jewelry matching that. Try mentioning a material like gold or silver, or an occasion like a wedding."
+
+        top_product = products[0]
+        name = top_product['product_name']
+        material = top_product['material']
+        price = int(top_product['price'])
+
+        if refinement == 'cheaper':
+            lead = f"A more affordable option is the {name} in {material}, at {price} rupees."
+        elif refinement == 'pricier':
+            lead = f"A more premium option is the {name} in {material}, at {price} rupees."
+        else:
+            lead = f"I'd recommend the {name} in {material}, at {price} rupees."
+
+        if len(products) == 1:
+            return lead
+
+        # Describe only the products not already named in the lead
+        others = products[1:]
+        if len(others) == 1:
+            return f"{lead} I have one more, at {int(others[0]['price'])} rupees."
+        min_price = int(min(p['price'] for p in others))
+        max_price = int(max(p['price'] for p in others))
+        return f"{lead} I have {len(others)} more, from {min_price} to {max_price} rupees."
+
+    def parse_refinement(self, query, last_price=None):
+        """
+        Detects follow-ups that only refine the previous results by price, material or colour.
+        Returns (filters, direction) or None if the query should run a fresh search.
+        direction is 'cheaper', 'pricier' or None.
+        """
+        q = query.lower().replace('?', ' ').replace('!', ' ').replace('.', ' ').replace(',', '')
+        filters = {}
+        direction = None
+
+        for phrases, name in ((CHEAPER_PHRASES, 'cheaper'), (PRICIER_PHRASES, 'pricier')):
+            for phrase in phrases:
+                if phrase in q:
+                    direction = name
+                    q = q.replace(phrase, ' ')
+        if direction == 'cheaper' and last_price is not None:
+            filters['max_price'] = last_price
+        elif direction == 'pricier' and last_price is not None:
+            filters['min_price'] = last_price
+
+        for pattern, key in ((MAX_PRICE_PATTERN, 'max_price'), (MIN_PRICE_PATTERN, 'min_price')):
+            match = pattern.search(q)
+            if match:
+                amount = float(match.group(1).replace(',', ''))
+                filters[key] = amount * 1000 if match.group(2) else amount
+                q = q.replace(match.group(0), ' ')
+
+        for key, vocab in (('material', self.material_vocab), ('color', self.color_vocab)):
+            for value in vocab:
+                pattern = r'\b' + re.escape(value) + r'\b'
+                if re.search(pattern, q):
+                    filters[key] = value
+                    q = re.sub(pattern, ' ', q)
+                    break
+
+        if not filters:
+            return None
+        # Anything left besides filler words means this is a new request, not a refinement
+        if set(q.split()) - FOLLOW_UP_FILLER:
+            return None
+        return filters, direction
+
+    def filter_mask(self, filters, positions=None):
+        """Boolean mask over the catalog (or over positions) for the given filters."""
+        idx = slice(None) if positions is None else positions
+        mask = np.ones(len(self.prices) if positions is None else len(positions), dtype=bool)
+        if 'max_price' in filters:
+            mask &= self.prices[idx] < filters['max_price']
+        if 'min_price' in filters:
+            mask &= self.prices[idx] > filters['min_price']
+        if 'material' in filters:
+            mask &= self.materials[idx] == filters['material']
+        if 'color' in filters:
+            mask &= self.colors[idx] == filters['color']
+        return mask
+
+    def find_candidates(self, query, session):
+        """
+        Returns (positions, scores, direction) for a query. Follow-ups that only refine
+        filters are answered from the session's cached candidates (or by re-ranking the
+        cached query embedding) instead of re-encoding and re-searching.
+        """
+        # The search state is one (query_embedding, candidates, scores, filters) tuple, read and
+        # replaced as a whole so concurrent requests on a session never see mixed arrays
+        state = session.get('search')
+        refinement = None
+        if state is not None:
+            refinement = self.parse_refinement(query, session.get('last_price'))
+
+        if refinement is None:
+            query_embedding = self.encode_query(query)
+            positions, scores = self.rank(query_embedding, SESSION_CANDIDATES)
+            session['search'] = (query_embedding, positions, scores, {})
+            return positions, scores, None
+
+        query_embedding, candidates, scores, filters = state
+        new_filters, direction = refinement
+        filters = dict(filters)
+        # "cheaper" after "more expensive" (or vice versa) replaces the old bound
+        if direction == 'cheaper':
+            filters.pop('min_price', None)
+        elif direction == 'pricier':
+            filters.pop('max_price', None)
+        filters.update(new_filters)
+        session['search'] = (query_embedding, candidates, scores, filters)
+
+        keep = self.filter_mask(filters, candidates)
+        if keep.any():
+            return candidates[keep], scores[keep], direction
+
+        # Nothing in the cached pool fits: re-rank the whole catalog with the cached embedding
+        positions, scores = self.rank(query_embedding, SESSION_CANDIDATES, mask=self.filter_mask(filters))
+        return positions, scores, direction
+
+    def process_voice_query(self, query, session=None, n=VOICE_RESULTS):
+        """
+        Voice path: retrieval only, speech-optimized text. If a session dict is given,
+        the candidate set is stored on it so follow-ups skip re-searching.
+        """
+        generic_response = self.get_generic_response(query)
+        if generic_response:
+            return generic_response
+
+        if self.products_df is None:
+            return self.generate_voice_response([])
+
+        if session is None:
+            session = {}
+
+        positions, scores, direction = self.find_candidates(query, session)
+        products = self.voice_products(positions[:n], scores[:n])
+        if products:
+            session['last_price'] = products[0]['price']
+        return self.generate_voice_response(products, direction)
+
     def get_generic_response(self, query):
         """
         Handles generic conversational queries to make the bot feel more natural.
@@ -210,9 +453,10 @@ class RAGEngine:
 
         return None
 
-    def process_query(self, query):
+    def process_query(self, query, session=None, n=4):
         """
         End-to-end processing: Search -> Generate -> Return
+        If a session dict is given, follow-up refinements reuse its cached candidates.
         """
         # 1. Check for generic conversational queries
         generic_response = self.get_generic_response(query)
@@ -223,7 +467,13 @@ class RAGEngine:
             }
 
         # 2. Product Search
-        products = self.search_products(query)
+        if session is None or self.products_df is None:
+            products = self.search_products(query, n)
+        else:
+            positions, scores, _ = self.find_candidates(query, session)
+            products = self.product_cards(positions[:n], scores[:n])
+            if products:
+                session['last_price'] = products[0]['price']
         response_text = self.generate_response(query, products)
         
         return {
@@ -0,0 +1,34 @@
+import numpy as np
+
+def top_k(scores, k):
+    """
+    Row-wise top-k for a 1-D or 2-D score array using argpartition.
+    Returns (indices, scores), each sorted by descending score.
+    """
+    scores = np.asarray(scores)
+    squeeze = scores.ndim == 1
+    if squeeze:
+        scores = scores.reshape(1, -1)
+
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0), dtype=int)
+        return (empty[0], scores[:, :0][0]) if squeeze else (empty, scores[:, :0])
+
+    if k < scores.shape[1]:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind='stable')
+    indices = np.take_along_axis(part, order, axis=1)
+    top_scores = np.take_along_axis(part_scores, order, axis=1)
+
+    if squeeze:
+        return indices[0], top_scores[0]
+    return indices, top_scores
+
+def blocks(n, block_size):
+    """Yields (start, stop) ranges covering n rows in chunks of block_size."""
+    for start in range(0, n, block_size):
+        yield start, min(start + block_size, n)
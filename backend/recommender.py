@@ -1,16 +1,27 @@
 import pandas as pd
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import linear_kernel
 import os
+from product_catalog import ProductCatalog
+from recommender_features import RecommendationFeatures
+from ranking import top_k, blocks
+
+# Rows scored per sparse matrix product in batch jobs (bounds the dense block to BATCH_BLOCK_SIZE x catalog size)
+BATCH_BLOCK_SIZE = 512
 
 class Recommender:
-    def __init__(self, data_path):
+    def __init__(self, data_path, field_weights=None, svd_components=None, catalog=None):
+        """
+        catalog: optional ProductCatalog shared with other engines loaded from the same data.
+        field_weights: optional {column: weight} overriding recommender_features.DEFAULT_FIELD_WEIGHTS.
+        svd_components: if set, score with a dense truncated-SVD embedding of that rank.
+        """
         self.data_path = data_path
         self.df = None
         self.products_df = None
-        self.tfidf_matrix = None
-        self.vectorizer = TfidfVectorizer(stop_words='english')
+        self.catalog = catalog
+        self.feature_matrix = None  # float32 CSR, L2-normalized rows
+        self.dense_embedding = None  # Optional low-rank float32 embedding, L2-normalized rows
+        self.features = RecommendationFeatures(field_weights, svd_components)
         self.load_data()
 
     def load_data(self):
@@ -31,52 +42,66 @@ class Recommender:
             if col in self.products_df.columns:
                 self.products_df[col] = self.products_df[col].fillna('')
 
+        # Reuse the shared catalog if one was injected for the same product table
+        if self.catalog is None or not self.catalog.matches(self.products_df):
+            self.catalog = ProductCatalog(self.products_df)
         self.train_content_based()
 
     def train_content_based(self):
-        # Build the 'soup' feature for recommendation
-        def create_soup(x):
-            return f"{x['Category']} {x['Material']} {x['Style']} {x['Color']} {x['Gender']} {x['Occasion']} {x['ProductName']}"
+        # Weighted one-hot attribute blocks + hashed name n-grams (see recommender_features)
+        self.feature_matrix, self.dense_embedding = self.features.fit_transform(self.products_df)
 
-        self.products_df['soup'] = self.products_df.apply(create_soup, axis=1)
-        self.tfidf_matrix = self.vectorizer.fit_transform(self.products_df['soup'])
+    def score_block(self, positions, n):
+        """
+        Top N similar products for a block of catalog positions (each product excluded from
+        its own list). One matrix product for the whole block: dense if an SVD embedding
+        was built, otherwise sparse x sparse.
+        """
+        positions = np.asarray(positions)
+        # Feature rows are L2-normalized, so the dot product is the cosine similarity
+        if self.dense_embedding is not None:
+            sims = self.dense_embedding[positions] @ self.dense_embedding.T
+        else:
+            sims = (self.feature_matrix[positions] @ self.feature_matrix.T).toarray()
+        sims[np.arange(len(positions)), positions] = -np.inf
+        return top_k(sims, min(n, sims.shape[1] - 1))
 
     def get_recommendations(self, sku, n=5):
-        if self.products_df is None or self.tfidf_matrix is None:
+        if self.products_df is None or self.feature_matrix is None:
             return []
 
-        # Find the index of the product that matches the SKU
-        idx_list = self.products_df.index[self.products_df['SKU'] == sku].tolist()
-        if not idx_list:
+        # Positional index of the product that matches the SKU
+        pos_idx = self.catalog.position(sku)
+        if pos_idx is None:
             return []
-        
-        # Get the actual positional index in the unique dataframe
-        pos_idx = self.products_df.index.get_loc(idx_list[0])
 
-        # Compute cosine similarity
-        cosine_sim = linear_kernel(self.tfidf_matrix[pos_idx:pos_idx+1], self.tfidf_matrix).flatten()
-        
         # Get top N similar products (excluding itself)
-        sim_scores = list(enumerate(cosine_sim))
-        sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-        sim_scores = sim_scores[1:n+1]
+        top_indices, top_scores = self.score_block([pos_idx], n)
+        return self.catalog.gather(self.catalog.recommend_cards, top_indices[0], top_scores[0])
 
-        recommendations = []
-        for i, score in sim_scores:
-            prod = self.products_df.iloc[i]
-            recommendations.append({
-                'product_id': str(prod['SKU']),
-                'product_name': str(prod['ProductName']),
-                'category_code': str(prod['Category']),
-                'price': float(prod['Price(INR)']),
-                'material': str(prod['Material']),
-                'color': str(prod['Color']),
-                'rating': float(prod['Rating']) if not pd.isna(prod['Rating']) else 0.0,
-                'stock': int(prod['Stock']) if not pd.isna(prod['Stock']) else 0,
-                'score': float(score)
-            })
+    def get_batch_recommendations(self, skus, n=5, block_size=BATCH_BLOCK_SIZE):
+        """
+        Yields (sku, recommendations) for every input SKU, in order, scoring block_size
+        SKUs per matrix product. recommendations is None for SKUs not in the catalog.
+        """
+        if self.products_df is None or self.feature_matrix is None:
+            for sku in skus:
+                yield sku, None
+            return
 
-        return recommendations
+        for start, stop in blocks(len(skus), block_size):
+            chunk = skus[start:stop]
+            chunk_positions = [self.catalog.position(sku) for sku in chunk]
+            known = [pos for pos in chunk_positions if pos is not None]
+            if known:
+                top_indices, top_scores = self.score_block(known, n)
+            row = 0
+            for sku, pos in zip(chunk, chunk_positions):
+                if pos is None:
+                    yield sku, None
+                    continue
+                yield sku, self.catalog.gather(self.catalog.recommend_cards, top_indices[row], top_scores[row])
+                row += 1
 
 if __name__ == "__main__":
     reco = Recommender("jewelry_combined.csv")
@@ -0,0 +1,81 @@
+import numpy as np
+import scipy.sparse as sp
+from sklearn.preprocessing import OneHotEncoder, normalize
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.decomposition import TruncatedSVD
+
+# Relative contribution of each field to the similarity score.
+# Structured attributes are one-hot encoded; 'ProductName' is a hashed word n-gram block.
+DEFAULT_FIELD_WEIGHTS = {
+    'Category': 3.0,
+    'Material': 2.0,
+    'Style': 1.0,
+    'Color': 1.0,
+    'Gender': 1.0,
+    'Occasion': 1.5,
+    'ProductName': 1.0,
+}
+NAME_FIELD = 'ProductName'
+NAME_HASH_FEATURES = 2 ** 12
+
+class RecommendationFeatures:
+    """
+    Builds the item feature matrix used for content-based recommendations.
+
+    Each structured field becomes a one-hot block and the product name a hashed
+    (1, 2)-gram block. Blocks are scaled by sqrt(weight), stacked into a float32
+    CSR matrix and L2-normalized, so a row dot product is a cosine similarity in
+    which each matching field contributes in proportion to its weight.
+    Optionally the matrix is folded into a low-rank dense embedding with truncated SVD.
+    """
+    def __init__(self, field_weights=None, svd_components=None):
+        self.field_weights = dict(DEFAULT_FIELD_WEIGHTS if field_weights is None else field_weights)
+        if not any(weight > 0 for weight in self.field_weights.values()):
+            raise ValueError(f"field_weights must give at least one field a positive weight, got {self.field_weights}")
+        self.svd_components = svd_components
+        self.encoders = {}
+        self.name_vectorizer = HashingVectorizer(
+            ngram_range=(1, 2), n_features=NAME_HASH_FEATURES, alternate_sign=False,
+            norm='l2', dtype=np.float32)
+        self.svd = None
+
+    def fit_transform(self, products_df):
+        """Returns (sparse_matrix, dense_embedding or None) for the product table."""
+        matrix = self.transform(products_df, fit=True)
+        dense = None
+        if self.svd_components:
+            n_components = min(self.svd_components, min(matrix.shape) - 1)
+            if n_components > 0:
+                self.svd = TruncatedSVD(n_components=n_components, random_state=0)
+                dense = normalize(self.svd.fit_transform(matrix)).astype(np.float32)
+        return matrix, dense
+
+    def transform(self, products_df, fit=False):
+        blocks = []
+        for field, weight in self.field_weights.items():
+            if weight <= 0 or field not in products_df.columns:
+                continue
+            values = products_df[field].fillna('').astype(str).str.strip()
+            if field == NAME_FIELD:
+                block = self.name_vectorizer.transform(values)
+            else:
+                if fit:
+                    # Only real values become categories; a missing ('') attribute encodes as an
+                    # all-zero row, so two products both lacking it don't count as a match
+                    categories = sorted(set(values) - {''})
+                    if not categories:
+                        continue
+                    self.encoders[field] = OneHotEncoder(
+                        categories=[categories], handle_unknown='ignore', dtype=np.float32)
+                    block = self.encoders[field].fit_transform(values.to_frame())
+                elif field in self.encoders:
+                    block = self.encoders[field].transform(values.to_frame())
+                else:
+                    continue
+            blocks.append(block * np.float32(np.sqrt(weight)))
+
+        if not blocks:
+            weighted = [f for f, w in self.field_weights.items() if w > 0]
+            raise ValueError(f"None of the weighted fields {weighted} are columns of the product table")
+        matrix = sp.hstack(blocks, format='csr', dtype=np.float32)
+        return normalize(matrix, norm='l2', copy=False)
@@ -0,0 +1,98 @@
+import os
+import time
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+class SessionStore:
+    """
+    Bounded, TTL-evicted conversation state shared by the chat and voice routes.
+
+    Sessions are plain dicts kept in memory in least-recently-used order. When the
+    store is full, the oldest session is either dropped or, if spill_path is set,
+    written to a SQLite file and loaded back the next time it is requested.
+    """
+    def __init__(self, max_sessions=1000, ttl_seconds=1800, spill_path=None):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.sessions = OrderedDict()  # session_id -> (last_access, session dict)
+        self.lock = threading.Lock()
+        self.db = None
+        if spill_path:
+            self.db = sqlite3.connect(spill_path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, touched REAL, data BLOB)")
+            self.db.commit()
+
+    def get(self, session_id):
+        """Returns the session dict for session_id, creating an empty one if needed."""
+        now = time.time()
+        with self.lock:
+            self.evict_expired(now)
+            entry = self.sessions.pop(session_id, None)
+            session = entry[1] if entry else self.load_spilled(session_id, now)
+            if session is None:
+                session = {}
+            self.sessions[session_id] = (now, session)
+            while len(self.sessions) > self.max_sessions:
+                old_id, (touched, old_session) = self.sessions.popitem(last=False)
+                self.spill(old_id, touched, old_session)
+            return session
+
+    def discard(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+            if self.db is not None:
+                self.db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                self.db.commit()
+
+    def evict_expired(self, now):
+        # OrderedDict is kept in access order, so expired sessions are all at the front
+        cutoff = now - self.ttl_seconds
+        while self.sessions:
+            session_id, (touched, _) = next(iter(self.sessions.items()))
+            if touched >= cutoff:
+                break
+            self.sessions.popitem(last=False)
+
+    def spill(self, session_id, touched, session):
+        if self.db is None:
+            return
+        try:
+            self.db.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                            (session_id, touched, pickle.dumps(session)))
+            self.db.execute("DELETE FROM sessions WHERE touched < ?", (time.time() - self.ttl_seconds,))
+            self.db.commit()
+        except Exception as e:
+            print(f"Failed to spill session {session_id}: {e}")
+
+    def load_spilled(self, session_id, now):
+        if self.db is None:
+            return None
+        row = self.db.execute("SELECT touched, data FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        self.db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        self.db.commit()
+        touched, data = row
+        if touched < now - self.ttl_seconds:
+            return None
+        return pickle.loads(data)
+
+def client_session_key(session_id):
+    """Store key for a session id supplied by the chat / voice UI."""
+    # Namespaced so a client-chosen id can never address a phone call's session
+    return f"web:{session_id}"
+
+def call_session_key(call_sid):
+    """Store key for a Twilio call."""
+    return f"call:{call_sid}"
+
+def create_session_store():
+    """Builds the store from SESSION_MAX / SESSION_TTL_SECONDS / SESSION_SPILL_PATH env vars."""
+    return SessionStore(
+        max_sessions=int(os.environ.get("SESSION_MAX", "1000")),
+        ttl_seconds=int(os.environ.get("SESSION_TTL_SECONDS", "1800")),
+        spill_path=os.environ.get("SESSION_SPILL_PATH") or None,
+    )
@@ -1,8 +1,16 @@
+import os
+import re
+import uuid
+import asyncio
+from typing import Optional
+from xml.sax.saxutils import escape
 from fastapi import APIRouter, Request, Form
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import Response
 from rag_engine import RAGEngine
-# Reuse the existing engine instance from main (will need to import or dependency inject, 
-# for now we'll import the class but ideally main.py passes the instance. 
+from session_store import client_session_key, call_session_key
+# Reuse the existing engine instance from main (will need to import or dependency inject,
+# for now we'll import the class but ideally main.py passes the instance.
 # To keep it simple and avoid circular imports, we will use a dedicated function to set the engine).
 
 router = APIRouter(tags=["Voice Agent"])
@@ -10,71 +18,125 @@ router = APIRouter(tags=["Voice Agent"])
 # Global reference to the RAG engine (set by main.py startup)
 rag_engine_instance = None
 
+# Max number of RAG queries the voice routes may run at once (each one encodes + scores the catalog)
+VOICE_RAG_CONCURRENCY = int(os.environ.get("VOICE_RAG_CONCURRENCY", "4"))
+rag_semaphore = None  # Created lazily so it binds to the server's event loop
+
+# Shared conversation store (set by main.py startup); Twilio calls are keyed by CallSid
+session_store = None
+
+# --- Precompiled TwiML ---
+# Everything except the spoken answer is static, so it is built once at import time.
+TWIML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+GATHER = '    <Gather input="speech" action="/voice/process" timeout="5" speechTimeout="auto">\n    </Gather>\n'
+
+GREETING_TWIML = (TWIML_HEADER + '<Response>\n'
+    '    <Say voice="alice">Hello! Thank you for calling AI Jewelry. I am your virtual assistant. How can I help you today?</Say>\n'
+    + GATHER +
+    "    <Say>I didn't hear anything. Please try calling back later. Goodbye.</Say>\n"
+    '</Response>').encode("utf-8")
+
+RETRY_TWIML = (TWIML_HEADER + '<Response>\n'
+    "    <Say voice=\"alice\">I'm sorry, I didn't catch that. Could you please repeat?</Say>\n"
+    + GATHER +
+    '</Response>').encode("utf-8")
+
+GOODBYE_TWIML = (TWIML_HEADER + '<Response>\n'
+    '    <Say voice="alice">Thank you for calling AI Jewelry. Have a wonderful day!</Say>\n'
+    '    <Hangup/>\n'
+    '</Response>').encode("utf-8")
+
+ANSWER_TWIML_PREFIX = (TWIML_HEADER + '<Response>\n    <Say voice="alice">').encode("utf-8")
+ANSWER_TWIML_SUFFIX = ('</Say>\n'
+    + GATHER +
+    '    <Say>Thank you for calling. Have a wonderful day!</Say>\n'
+    '</Response>').encode("utf-8")
+
+# Characters that are not allowed anywhere in an XML 1.0 document
+INVALID_XML_CHARS = re.compile('[^\u0009\u000A\u000D\u0020-\uD7FF\uE000-\uFFFD]')
+GOODBYE_WORDS = {'bye', 'goodbye'}
+GOODBYE_PHRASES = {'no', 'no thanks', 'no thank you', 'nothing', "that's all", 'that is all'}
+
 def set_rag_engine(engine):
     global rag_engine_instance
     rag_engine_instance = engine
 
+def set_session_store(store):
+    global session_store
+    session_store = store
+
+def get_rag_semaphore():
+    global rag_semaphore
+    if rag_semaphore is None:
+        rag_semaphore = asyncio.Semaphore(VOICE_RAG_CONCURRENCY)
+    return rag_semaphore
+
+async def run_engine(func, *args):
+    """Runs a blocking RAGEngine call off the event loop, bounded by VOICE_RAG_CONCURRENCY."""
+    async with get_rag_semaphore():
+        return await run_in_threadpool(func, *args)
+
+def voice_answer(message, session_key=None):
+    """Blocking: loads the session (if any) and runs the voice query against it."""
+    session = None
+    if session_key and session_store is not None:
+        session = session_store.get(session_key)
+    return rag_engine_instance.process_voice_query(message, session)
+
+def speech_text(text):
+    """Strips markdown emphasis and characters that can't be spoken or embedded in XML."""
+    return INVALID_XML_CHARS.sub('', text.replace("*", ""))
+
+def xml_escape(text):
+    return escape(speech_text(text), {'"': "&quot;", "'": "&apos;"})
+
+def is_goodbye(text):
+    t = text.lower().strip(' .!?')
+    return t in GOODBYE_PHRASES or bool(GOODBYE_WORDS & set(t.replace(',', ' ').split()))
+
+def twiml(content):
+    return Response(content=content, media_type="application/xml")
+
 @router.post("/voice/start")
 async def voice_start(From: str = Form(None)):
     """
     Twilio Webhook: Called when a call comes in.
     Returns TwiML to greet the user and gather input.
     """
-    # TwiML response
-    twiml_response = """<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="alice">Hello! Thank you for calling AI Jewelry. I am your virtual assistant. How can I help you today?</Say>
-    <Gather input="speech" action="/voice/process" timeout="5" speechTimeout="auto">
-    </Gather>
-    <Say>I didn't hear anything. Please try calling back later. Goodbye.</Say>
-</Response>"""
-    return Response(content=twiml_response, media_type="application/xml")
+    return twiml(GREETING_TWIML)
 
 @router.post("/voice/process")
-async def voice_process(SpeechResult: str = Form(None)):
+async def voice_process(SpeechResult: str = Form(None), CallSid: str = Form(None)):
     """
     Twilio Webhook: Called after the user speaks.
     Processes the speech using RAG and returns the response.
     """
     if not SpeechResult:
-        twiml_response = """<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="alice">I'm sorry, I didn't catch that. Could you please repeat?</Say>
-    <Gather input="speech" action="/voice/process" timeout="5">
-    </Gather>
-</Response>"""
-        return Response(content=twiml_response, media_type="application/xml")
+        return twiml(RETRY_TWIML)
 
     # Process query
     print(f"User said: {SpeechResult}")
-    
+
+    call_key = call_session_key(CallSid) if CallSid else None
+    if is_goodbye(SpeechResult):
+        if call_key and session_store is not None:
+            await run_in_threadpool(session_store.discard, call_key)
+        return twiml(GOODBYE_TWIML)
+
     if rag_engine_instance:
-        result = rag_engine_instance.process_query(SpeechResult)
-        ai_response = result['response_text']
-        
-        # Simplify response for voice (remove markdown artifacts if any)
-        ai_response = ai_response.replace("**", "")
+        ai_response = await run_engine(voice_answer, SpeechResult, call_key)
     else:
         ai_response = "I'm currently having trouble accessing my brain. Please try again later."
 
     # TwiML response loop
-    twiml_response = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="alice">{ai_response}</Say>
-    <Pause length="1"/>
-    <Say voice="alice">Is there anything else I can help you with?</Say>
-    <Gather input="speech" action="/voice/process" timeout="5" speechTimeout="auto">
-    </Gather>
-    <Say>Thank you for calling. Have a wonderful day!</Say>
-</Response>"""
-    
-    
-    return Response(content=twiml_response, media_type="application/xml")
+    ai_response += " Is there anything else I can help you with?"
+    return twiml(ANSWER_TWIML_PREFIX + xml_escape(ai_response).encode("utf-8") + ANSWER_TWIML_SUFFIX)
 
 from pydantic import BaseModel
 
 class VoiceRequest(BaseModel):
     message: str
+    session_id: Optional[str] = None
 
 @router.post("/voice/chat")
 async def voice_chat_frontend(request: VoiceRequest):
@@ -83,10 +145,8 @@ async def voice_chat_frontend(request: VoiceRequest):
     returns text for browser Text-to-Speech.
     """
     if rag_engine_instance:
-        result = rag_engine_instance.process_query(request.message)
-        ai_response = result['response_text']
-        # Clean up for speech
-        ai_response = ai_response.replace("**", "").replace("*", "")
-        return {"response": ai_response}
+        session_id = request.session_id or uuid.uuid4().hex
+        ai_response = await run_engine(voice_answer, request.message, client_session_key(session_id))
+        return {"response": speech_text(ai_response), "session_id": session_id}
     else:
         return {"response": "I'm currently offline. Please check back later."}
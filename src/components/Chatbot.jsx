@@ -9,6 +9,7 @@ const Chatbot = () => {
     const [inputStr, setInputStr] = useState('');
     const [isLoading, setIsLoading] = useState(false);
     const messagesEndRef = useRef(null);
+    const sessionIdRef = useRef(null); // Lets the backend answer follow-ups like "cheaper ones" from the last results
 
     const formatPrice = (price) => {
         return new Intl.NumberFormat('en-IN', {
@@ -43,7 +44,7 @@ const Chatbot = () => {
             const response = await fetch(`${apiUrl}/chat`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ message: userMessage })
+                body: JSON.stringify({ message: userMessage, session_id: sessionIdRef.current })
             });
 
             if (!response.ok) {
@@ -51,6 +52,7 @@ const Chatbot = () => {
             }
 
             const data = await response.json();
+            if (data.session_id) sessionIdRef.current = data.session_id;
 
             // Add text response
             setMessages(prev => [...prev, { type: 'bot', text: data.response_text }]);
@@ -11,6 +11,7 @@ const VoiceAgent = () => {
     const [messages, setMessages] = useState([]);
     const messagesEndRef = useRef(null);
     const transcriptRef = useRef(''); // Use ref to track transcript without re-rendering effect
+    const sessionIdRef = useRef(null); // Lets the backend answer follow-ups like "cheaper ones" from the last results
 
     const recognitionRef = useRef(null);
     const synthRef = useRef(window.speechSynthesis);
@@ -80,13 +81,14 @@ const VoiceAgent = () => {
             const res = await fetch(`${apiUrl}/voice/chat`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ message: query })
+                body: JSON.stringify({ message: query, session_id: sessionIdRef.current })
             });
 
             if (!res.ok) throw new Error(`Server error: ${res.status}`);
 
             const data = await res.json();
             console.log("Voice Response:", data);
+            if (data.session_id) sessionIdRef.current = data.session_id;
 
             setMessages(prev => [...prev, { type: 'bot', text: data.response }]);
             setTranscript('');